@@ -25,6 +25,11 @@ CORS(app, origins="*")
 DATA_DIR = os.environ.get('DATA_DIR', os.path.join(os.path.dirname(__file__), '..', 'data'))
 logger.info(f"Data directory: {DATA_DIR}")
 
+# File serving options (documented in config/production.py)
+if 'SEND_FILE_MAX_AGE_DEFAULT' in os.environ:
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = int(os.environ['SEND_FILE_MAX_AGE_DEFAULT'])
+app.config['USE_X_ACCEL_REDIRECT'] = os.environ.get('USE_X_ACCEL_REDIRECT', 'false').lower() == 'true'
+
 
 @app.errorhandler(404)
 def not_found(error):
@@ -80,7 +85,16 @@ os.makedirs(DATA_DIR, exist_ok=True)
 
 # Initialize FileService
 try:
-    file_service = FileService(DATA_DIR)
+    # Each gunicorn worker process has its own thumbnail pool, so the CPUs are
+    # split between the workers rather than each one using all of them
+    gunicorn_workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+    file_service = FileService(
+        DATA_DIR,
+        warm_thumbnails_on_scan=os.environ.get('WARM_THUMBNAILS', 'true').lower() == 'true',
+        thumbnail_workers=max(1, (os.cpu_count() or 1) // gunicorn_workers),
+        thumbnail_memory_cache_size=int(os.environ.get('THUMBNAIL_MEMORY_CACHE_SIZE', 512)),
+        stat_workers=int(os.environ.get('STAT_WORKERS', 1))
+    )
     logger.info(f"FileService initialized with directory: {DATA_DIR}")
 except Exception as e:
     logger.error(f"Failed to initialize FileService: {e}")
@@ -3,24 +3,45 @@ API Routes for File Gallery Viewer
 Provides endpoints for file listing, image serving, and CSV downloads
 """
 
+import io
 import os
 import logging
+import functools
 from pathlib import Path
-from flask import Blueprint, jsonify, send_file, abort
+from urllib.parse import quote
+from flask import Blueprint, Response, current_app, jsonify, request, send_file, abort
 from werkzeug.utils import secure_filename
 
 logger = logging.getLogger(__name__)
 
-api_bp = Blueprint('api', __name__, url_prefix='/api')
+def is_within_directory(file_path: str, directory: str) -> bool:
+    """
+    Check whether a normalized absolute path lies inside a directory
+    
+    Compares whole path components, so '/data2/a.png' is not inside '/data'.
+    
+    Args:
+        file_path: Normalized absolute file path
+        directory: Normalized absolute directory path
+        
+    Returns:
+        True if file_path is inside directory
+    """
+    return os.path.commonpath([file_path, directory]) == directory
 
 
+@functools.lru_cache(maxsize=4096)
 def validate_filename(filename: str, data_dir: str) -> Path:
     """
     Validate filename and prevent directory traversal attacks
     
+    The result only depends on the arguments (no filesystem or working
+    directory lookups), so validated paths are memoized; rejected filenames
+    raise every time.
+    
     Args:
         filename: The filename to validate
-        data_dir: The base data directory
+        data_dir: The base data directory, already made absolute by the caller
         
     Returns:
         Validated Path object
@@ -37,17 +58,46 @@ def validate_filename(filename: str, data_dir: str) -> Path:
     if not safe_filename:
         raise ValueError("Invalid filename")
     
-    # Construct the full path
-    data_path = Path(data_dir).resolve()
-    file_path = (data_path / safe_filename).resolve()
+    # Construct the full path (normpath is purely lexical; unlike resolve()
+    # it does not stat every path component)
+    data_path = os.path.normpath(data_dir)
+    file_path = os.path.normpath(os.path.join(data_path, safe_filename))
     
     # Ensure the file path is within the data directory (prevent directory traversal)
-    if not str(file_path).startswith(str(data_path)):
+    if not is_within_directory(file_path, data_path):
         raise ValueError("Invalid file path - directory traversal detected")
     
-    return file_path
+    return Path(file_path)
 
 
+def send_data_file(file_path: Path, mimetype: str, as_attachment: bool = False,
+                   download_name: str = None) -> Response:
+    """
+    Send a file from the data directory
+    
+    With USE_X_ACCEL_REDIRECT enabled, an empty response carrying an
+    X-Accel-Redirect header is returned and nginx serves the file body
+    itself from its internal /internal/ location.
+    
+    Args:
+        file_path: Validated path of the file to send
+        mimetype: MIME type of the file
+        as_attachment: Whether to send the file as a download
+        download_name: Filename presented to the browser for downloads
+        
+    Returns:
+        Flask Response object
+    """
+    if current_app.config.get('USE_X_ACCEL_REDIRECT'):
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f"/internal/{quote(file_path.name)}"
+        if as_attachment:
+            response.headers.set('Content-Disposition', 'attachment',
+                                 filename=download_name or file_path.name)
+        return response
+    
+    return send_file(file_path, mimetype=mimetype, as_attachment=as_attachment,
+                     download_name=download_name, conditional=True, etag=True)
 
 
 
@@ -75,16 +125,20 @@ def register_routes(app, file_service, data_dir):
         file_service: FileService instance
         data_dir: Base data directory path
     """
+    # Resolve a relative data directory once, against the working directory
+    # at registration, so validate_filename stays independent of the cwd
+    data_dir = os.path.abspath(data_dir)
+    
+    # A fresh blueprint per call, so routes can be registered on more than one app
+    api_bp = Blueprint('api', __name__, url_prefix='/api')
     
     @api_bp.route('/files', methods=['GET'])
     def get_files():
         try:
             logger.info("Scanning files...")
             matches = file_service.scan_files()
-            files_data = [match.to_dict() for match in matches]
-            response = {'files': files_data, 'total_count': len(files_data)}
-            logger.info(f"Found {len(files_data)} PNG files")
-            return jsonify(response), 200
+            logger.info(f"Found {len(matches)} PNG files")
+            return Response(file_service.get_files_json(matches), mimetype='application/json'), 200
         except Exception as e:
             logger.error(f"Error scanning files: {e}")
             return jsonify({'error': 'Failed to scan files', 'message': str(e)}), 500
@@ -97,7 +151,7 @@ def register_routes(app, file_service, data_dir):
                 abort(404, description=f"Image not found: {filename}")
             if not filename.lower().endswith('.png'):
                 abort(400, description="Only PNG files are allowed")
-            return send_file(file_path, mimetype='image/png')
+            return send_data_file(file_path, mimetype='image/png')
         except ValueError as e:
             abort(403, description=str(e))
         except Exception as e:
@@ -113,13 +167,25 @@ def register_routes(app, file_service, data_dir):
             if not filename.lower().endswith('.png'):
                 abort(400, description="Only PNG files are allowed")
             
-            # Generate thumbnail
-            thumbnail_bytes = file_service.generate_thumbnail(file_path)
-            if thumbnail_bytes is None:
+            # Generate thumbnail (or reuse the cached one on disk)
+            thumbnail_path = file_service.ensure_thumbnail(file_path)
+            if thumbnail_path is None:
                 abort(500, description="Failed to generate thumbnail")
             
-            from flask import Response
-            return Response(thumbnail_bytes, mimetype='image/jpeg')
+            # The content-keyed file name doubles as a stable ETag, so
+            # revalidations are answered without reading the thumbnail
+            etag = thumbnail_path.stem
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            
+            # Hot thumbnails are served from memory, the rest straight from disk
+            thumbnail_bytes = file_service.get_cached_thumbnail(thumbnail_path)
+            if thumbnail_bytes is not None:
+                return send_file(io.BytesIO(thumbnail_bytes), mimetype='image/jpeg',
+                                 etag=etag, conditional=True)
+            return send_file(thumbnail_path, mimetype='image/jpeg', etag=etag, conditional=True)
         except ValueError as e:
             abort(403, description=str(e))
         except Exception as e:
@@ -134,7 +200,7 @@ def register_routes(app, file_service, data_dir):
                 abort(404, description=f"CSV file not found: {filename}")
             if not filename.lower().endswith('.csv'):
                 abort(400, description="Only CSV files are allowed")
-            return send_file(file_path, mimetype='text/csv', as_attachment=True, download_name=filename)
+            return send_data_file(file_path, mimetype='text/csv', as_attachment=True, download_name=filename)
         except ValueError as e:
             abort(403, description=str(e))
         except Exception as e:
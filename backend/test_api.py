@@ -6,10 +6,12 @@ Tests API endpoint responses and security validation
 import unittest
 import tempfile
 import os
+import shutil
 from pathlib import Path
+from PIL import Image
 from flask import Flask
 from services.file_service import FileService
-from routes.api import register_routes, validate_filename
+from routes.api import register_routes, validate_filename, is_within_directory
 
 
 class TestAPIRoutes(unittest.TestCase):
@@ -36,9 +38,7 @@ class TestAPIRoutes(unittest.TestCase):
     
     def tearDown(self):
         """Clean up test fixtures"""
-        for file in Path(self.test_dir).glob("*"):
-            file.unlink()
-        os.rmdir(self.test_dir)
+        shutil.rmtree(self.test_dir)
     
     def test_get_files_endpoint(self):
         """Test GET /api/files endpoint"""
@@ -92,6 +92,73 @@ class TestAPIRoutes(unittest.TestCase):
         response = self.client.get('/api/download/nonexistent.csv')
         
         self.assertEqual(response.status_code, 404)
+    
+    def test_get_thumbnail_etag(self):
+        """Test thumbnails carry their content key as ETag and revalidate with 304"""
+        Image.new('RGB', (800, 600), 'red').save(self.png_file)
+        
+        response = self.client.get('/api/thumbnail/test.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        
+        etag, _ = response.get_etag()
+        self.assertEqual(etag, self.file_service.ensure_thumbnail(self.png_file).stem)
+        
+        response = self.client.get('/api/thumbnail/test.png', headers={'If-None-Match': f'"{etag}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+    
+    def test_get_thumbnail_from_disk(self):
+        """Test thumbnails not held in memory are served from disk"""
+        Image.new('RGB', (800, 600), 'red').save(self.png_file)
+        thumbnail_path = self.file_service.ensure_thumbnail(self.png_file)
+        
+        app = Flask(__name__)
+        file_service = FileService(self.test_dir, thumbnail_memory_cache_size=0)
+        register_routes(app, file_service, self.test_dir)
+        response = app.test_client().get('/api/thumbnail/test.png')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, thumbnail_path.read_bytes())
+        self.assertIsNone(file_service.get_cached_thumbnail(thumbnail_path))
+    
+    def test_relative_data_dir(self):
+        """Test a relative data directory is resolved once, at registration"""
+        cwd = os.getcwd()
+        os.chdir(os.path.dirname(self.test_dir))
+        try:
+            app = Flask(__name__)
+            register_routes(app, self.file_service, os.path.basename(self.test_dir))
+            client = app.test_client()
+            
+            self.assertEqual(client.get('/api/image/test.png').status_code, 200)
+            self.assertEqual(client.get('/api/download/test.csv').status_code, 200)
+        finally:
+            os.chdir(cwd)
+        
+        # Later working directory changes do not move the data directory
+        self.assertEqual(client.get('/api/image/test.png').status_code, 200)
+    
+    def test_get_image_x_accel_redirect(self):
+        """Test GET /api/image/<filename> hands the body off to nginx"""
+        self.app.config['USE_X_ACCEL_REDIRECT'] = True
+        response = self.client.get('/api/image/test.png')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/internal/test.png')
+        self.assertEqual(response.data, b'')
+    
+    def test_download_csv_x_accel_redirect(self):
+        """Test GET /api/download/<filename> keeps the attachment header with X-Accel-Redirect"""
+        self.app.config['USE_X_ACCEL_REDIRECT'] = True
+        response = self.client.get('/api/download/test.csv')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/internal/test.csv')
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename=test.csv')
+        self.assertEqual(response.data, b'')
 
 
 class TestSecurityValidation(unittest.TestCase):
@@ -125,6 +192,17 @@ class TestSecurityValidation(unittest.TestCase):
         """Test validate_filename ensures path is within data directory"""
         result = validate_filename("test.png", self.test_dir)
         self.assertTrue(str(result).startswith(str(Path(self.test_dir).resolve())))
+    
+    def test_validate_filename_ignores_working_directory(self):
+        """Test validate_filename depends only on its arguments, not on the cwd"""
+        result = validate_filename("test.png", "data")
+        self.assertEqual(result, Path("data") / "test.png")
+    
+    def test_is_within_directory_sibling_prefix(self):
+        """Test a sibling directory sharing the data directory's prefix is rejected"""
+        data_dir = os.path.abspath(self.test_dir)
+        self.assertTrue(is_within_directory(os.path.join(data_dir, "a.png"), data_dir))
+        self.assertFalse(is_within_directory(os.path.join(data_dir + "2", "a.png"), data_dir))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,52 @@
+"""
+Unit tests for the application entry point
+Tests FileService configuration from the environment
+"""
+
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+import importlib
+from unittest import mock
+
+
+class TestAppConfiguration(unittest.TestCase):
+    """Test cases for app.py environment configuration"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.test_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        """Clean up test fixtures"""
+        sys.modules.pop('app', None)
+        shutil.rmtree(self.test_dir)
+    
+    def import_app(self, **environ):
+        """Import a fresh app module with the given environment"""
+        sys.modules.pop('app', None)
+        with mock.patch.dict(os.environ, {'DATA_DIR': self.test_dir, **environ}):
+            return importlib.import_module('app')
+    
+    def test_thumbnail_workers_split_across_gunicorn_workers(self):
+        """Test each gunicorn worker gets its share of the CPUs for thumbnails"""
+        with mock.patch('os.cpu_count', return_value=8):
+            app = self.import_app(GUNICORN_WORKERS='4')
+        self.assertEqual(app.file_service.thumbnail_workers, 2)
+    
+    def test_thumbnail_workers_at_least_one(self):
+        """Test more gunicorn workers than CPUs still leaves one thumbnail thread"""
+        with mock.patch('os.cpu_count', return_value=2):
+            app = self.import_app(GUNICORN_WORKERS='4')
+        self.assertEqual(app.file_service.thumbnail_workers, 1)
+    
+    def test_warm_thumbnails_opt_out(self):
+        """Test WARM_THUMBNAILS=false disables background thumbnail generation"""
+        self.assertTrue(self.import_app().file_service.warm_thumbnails_on_scan)
+        self.assertFalse(self.import_app(WARM_THUMBNAILS='false').file_service.warm_thumbnails_on_scan)
+
+
+if __name__ == '__main__':
+    unittest.main()
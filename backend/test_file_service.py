@@ -6,7 +6,13 @@ Tests file scanning and matching logic
 import unittest
 import tempfile
 import os
+import shutil
+import json
+import time
+import threading
 from pathlib import Path
+from unittest import mock
+from PIL import Image
 from services.file_service import FileService, FileInfo, FileMatch
 
 
@@ -39,10 +45,8 @@ class TestFileService(unittest.TestCase):
     
     def tearDown(self):
         """Clean up test fixtures"""
-        # Remove all test files
-        for file in Path(self.test_dir).glob("*"):
-            file.unlink()
-        os.rmdir(self.test_dir)
+        # Remove all test files, including the thumbnail cache
+        shutil.rmtree(self.test_dir)
     
     def test_init_valid_directory(self):
         """Test FileService initialization with valid directory"""
@@ -56,7 +60,7 @@ class TestFileService(unittest.TestCase):
     
     def test_scan_png_files(self):
         """Test scanning for PNG files"""
-        png_files = self.file_service._scan_png_files()
+        png_files, _, _ = self.file_service._scan_all()
         self.assertEqual(len(png_files), 3)
         
         png_names = [f.name for f in png_files]
@@ -66,17 +70,38 @@ class TestFileService(unittest.TestCase):
     
     def test_scan_csv_files(self):
         """Test scanning for CSV files"""
-        csv_files = self.file_service._scan_csv_files()
+        _, csv_files, _ = self.file_service._scan_all()
         self.assertEqual(len(csv_files), 2)
         
         csv_names = [f.name for f in csv_files]
         self.assertIn("1.csv", csv_names)
         self.assertIn("test.csv", csv_names)
     
+    def test_scan_parallel_stat(self):
+        """Test a parallel stat scan matches a serial one"""
+        service = FileService(self.test_dir, stat_workers=2)
+        png_files, csv_files, state_hash = service._scan_all()
+        
+        self.assertEqual(sorted(f.name for f in png_files), ["1.png", "2.png", "test.PNG"])
+        self.assertEqual(len(csv_files), 2)
+        self.assertEqual(state_hash, self.file_service._scan_all()[2])
+    
+    def test_scan_state_hash_includes_inode(self):
+        """Test replacing a file with a same-size, same-mtime copy changes the state hash"""
+        _, _, state_hash = self.file_service._scan_all()
+        
+        stat = self.png1.stat()
+        replacement = Path(self.test_dir) / "1.png.tmp"
+        replacement.write_bytes(b"fake png data 9")
+        self.assertEqual(replacement.stat().st_size, stat.st_size)
+        os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(replacement, self.png1)
+        
+        self.assertNotEqual(self.file_service._scan_all()[2], state_hash)
+    
     def test_match_files(self):
         """Test matching PNG files with CSV files"""
-        png_files = self.file_service._scan_png_files()
-        csv_files = self.file_service._scan_csv_files()
+        png_files, csv_files, _ = self.file_service._scan_all()
         
         matches = self.file_service.match_files(png_files, csv_files)
         
@@ -100,6 +125,205 @@ class TestFileService(unittest.TestCase):
         
         self.assertEqual(len(matches), 3)
         self.assertIsInstance(matches[0], FileMatch)
+    
+    def test_scan_reuses_file_info(self):
+        """Test unchanged files keep their FileInfo and changed files get a new one"""
+        matches = self.file_service.scan_files(use_cache=False)
+        infos = {m.png_file.name: m.png_file for m in matches}
+        
+        self.png2.write_bytes(b"changed fake png data 2")
+        self.csv1.unlink()
+        
+        new_matches = self.file_service.scan_files(use_cache=False)
+        new_infos = {m.png_file.name: m.png_file for m in new_matches}
+        
+        self.assertIs(new_infos["1.png"], infos["1.png"])
+        self.assertIs(new_infos["test.PNG"], infos["test.PNG"])
+        self.assertIsNot(new_infos["2.png"], infos["2.png"])
+        self.assertEqual(new_infos["2.png"].size, len(b"changed fake png data 2"))
+        self.assertNotIn(b"1.csv", self.file_service._info_cache)
+    
+    def bump_directory_mtime(self):
+        """Move the test directory's mtime forward, as adding an entry would"""
+        stat = os.stat(self.test_dir)
+        os.utime(self.test_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    
+    def test_scan_files_directory_change(self):
+        """Test a new entry in the directory triggers a rescan"""
+        matches = self.file_service.scan_files()
+        self.assertIs(self.file_service.scan_files(), matches)
+        
+        (Path(self.test_dir) / "3.png").write_bytes(b"fake png data 4")
+        self.bump_directory_mtime()
+        
+        new_matches = self.file_service.scan_files()
+        self.assertIsNot(new_matches, matches)
+        self.assertEqual(len(new_matches), 4)
+    
+    def test_scan_files_unrelated_change(self):
+        """Test a new non-PNG/CSV file keeps the cached match list"""
+        matches = self.file_service.scan_files()
+        
+        (Path(self.test_dir) / "notes.txt").write_text("unrelated")
+        self.bump_directory_mtime()
+        
+        self.assertIs(self.file_service.scan_files(), matches)
+    
+    def test_scan_files_in_place_edit(self):
+        """Test an in-place edit is only picked up once the cache TTL expires"""
+        with mock.patch('services.file_service.time.time', return_value=1000.0):
+            matches = self.file_service.scan_files()
+        
+        self.png1.write_bytes(b"edited fake png data 1")
+        
+        with mock.patch('services.file_service.time.time', return_value=1010.0):
+            self.assertIs(self.file_service.scan_files(), matches)
+        
+        with mock.patch('services.file_service.time.time',
+                        return_value=1001.0 + self.file_service.cache_ttl):
+            new_matches = self.file_service.scan_files()
+        self.assertIsNot(new_matches, matches)
+        match1 = next(m for m in new_matches if m.png_file.name == "1.png")
+        self.assertEqual(match1.png_file.size, len(b"edited fake png data 1"))
+    
+    def test_scan_files_concurrent_publish(self):
+        """Test a slow scan finishing during a newer scan's publish leaves a consistent cache"""
+        a_scanned = threading.Event()
+        a_resume = threading.Event()
+        scan_all = self.file_service._scan_all
+        
+        def slow_scan_all():
+            result = scan_all()
+            if threading.current_thread() is scan_a:
+                a_scanned.set()
+                a_resume.wait()
+            return result
+        
+        real_time = time.time
+        resumed = []
+        
+        def interleaving_time():
+            # Let scan A publish its old listing in the middle of scan B's publish
+            if threading.current_thread() is not scan_a and not resumed:
+                resumed.append(True)
+                a_resume.set()
+                scan_a.join()
+            return real_time()
+        
+        with mock.patch.object(self.file_service, '_scan_all', slow_scan_all), \
+                mock.patch('services.file_service.time.time', interleaving_time):
+            scan_a = threading.Thread(target=self.file_service.scan_files)
+            scan_a.start()
+            a_scanned.wait()
+            
+            (Path(self.test_dir) / "3.png").write_bytes(b"fake png data 4")
+            self.bump_directory_mtime()
+            self.assertEqual(len(self.file_service.scan_files()), 4)
+        
+        self.assertEqual(len(self.file_service.scan_files()), 4)
+    
+    def test_ensure_thumbnail_key(self):
+        """Test thumbnails are sharded by key and rekeyed when the image is replaced"""
+        image_path = Path(self.test_dir) / "image.png"
+        Image.new('RGB', (800, 600), 'red').save(image_path, compress_level=0)
+        
+        thumbnail_path = self.file_service.ensure_thumbnail(image_path)
+        self.assertTrue(thumbnail_path.exists())
+        self.assertEqual(thumbnail_path.parent.parent, self.file_service.thumbnail_dir)
+        self.assertEqual(thumbnail_path.parent.name, thumbnail_path.stem[:2])
+        self.assertEqual(self.file_service.ensure_thumbnail(image_path), thumbnail_path)
+        
+        # Replace the image the way rsync does: same size, mtime preserved
+        stat = image_path.stat()
+        replacement = Path(self.test_dir) / "image.png.tmp"
+        Image.new('RGB', (800, 600), 'blue').save(replacement, 'PNG', compress_level=0)
+        self.assertEqual(replacement.stat().st_size, stat.st_size)
+        os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(replacement, image_path)
+        
+        self.assertNotEqual(self.file_service.ensure_thumbnail(image_path), thumbnail_path)
+    
+    def make_gallery(self, count):
+        """Create a directory of real PNG images and a FileService for it"""
+        gallery_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, gallery_dir)
+        for i in range(count):
+            Image.new('RGB', (800, 600), (i * 40, 0, 0)).save(Path(gallery_dir) / f"{i}.png")
+        return FileService(gallery_dir, thumbnail_workers=2)
+    
+    def test_warm_thumbnails(self):
+        """Test warming generates every thumbnail in the background pool"""
+        service = self.make_gallery(3)
+        service.warm_thumbnails(service.scan_files())
+        service._thumb_pool.shutdown(wait=True)
+        
+        self.assertEqual(len(list(service.thumbnail_dir.glob("*/*.jpg"))), 3)
+        self.assertEqual(service._pending_thumbnails, set())
+    
+    def test_warm_thumbnails_skips_pending(self):
+        """Test images already queued for warming are not queued again"""
+        service = self.make_gallery(3)
+        matches = service.scan_files()
+        service._pending_thumbnails.add(Path(os.fsdecode(matches[0].png_file.path)))
+        
+        service.warm_thumbnails(matches)
+        service._thumb_pool.shutdown(wait=True)
+        
+        self.assertEqual(len(list(service.thumbnail_dir.glob("*/*.jpg"))), 2)
+    
+    def test_warm_thumbnails_logs_failures(self):
+        """Test thumbnails that cannot be generated are logged from the pool"""
+        with self.assertLogs('services.file_service', level='ERROR') as logs:
+            self.file_service.warm_thumbnails(self.file_service.scan_files())
+            self.file_service._thumb_pool.shutdown(wait=True)
+        
+        self.assertEqual(len(logs.records), 3)
+    
+    def test_count_thumbnails(self):
+        """Test the thumbnail count covers every shard and skips temporary files"""
+        for key in ("aa01", "aa02", "bb01"):
+            shard = self.file_service.thumbnail_dir / key[:2]
+            shard.mkdir(exist_ok=True)
+            (shard / f"{key}.jpg").write_bytes(b"fake jpeg")
+        (self.file_service.thumbnail_dir / "aa" / "aa03.1.2.tmp").write_bytes(b"partial")
+        
+        self.assertEqual(self.file_service.get_cache_stats()['thumbnail_count'], 3)
+    
+    def test_remove_legacy_thumbnails(self):
+        """Test thumbnails from the old flat layout are removed on startup"""
+        legacy = self.file_service.thumbnail_dir / "1_thumb.jpg"
+        legacy.write_bytes(b"fake jpeg")
+        shard = self.file_service.thumbnail_dir / "aa"
+        shard.mkdir()
+        (shard / "aa01.jpg").write_bytes(b"fake jpeg")
+        
+        service = FileService(self.test_dir)
+        
+        self.assertFalse(legacy.exists())
+        self.assertTrue((shard / "aa01.jpg").exists())
+        self.assertEqual(service.get_cache_stats()['thumbnail_count'], 1)
+    
+    def test_get_files_json(self):
+        """Test the file listing body is memoized until the cache is invalidated"""
+        body = self.file_service.get_files_json()
+        self.assertEqual(json.loads(body)['total_count'], 3)
+        self.assertIs(self.file_service.get_files_json(), body)
+        
+        (Path(self.test_dir) / "3.png").write_bytes(b"fake png data 4")
+        self.file_service.invalidate_cache()
+        
+        new_body = self.file_service.get_files_json()
+        self.assertIsNot(new_body, body)
+        self.assertEqual(json.loads(new_body)['total_count'], 4)
+    
+    @unittest.skipIf(os.name == 'nt', "Non-UTF-8 filenames require a bytes filesystem")
+    def test_get_files_json_undecodable_name(self):
+        """Test a filename that is not valid UTF-8 does not break the listing"""
+        with open(os.path.join(os.fsencode(self.test_dir), b"bad\xff.png"), 'wb') as f:
+            f.write(b"fake png data 5")
+        
+        data = json.loads(self.file_service.get_files_json())
+        self.assertEqual(data['total_count'], 4)
 
 
 if __name__ == '__main__':
@@ -33,6 +33,34 @@ class ProductionConfig:
     # Cache settings
     CACHE_TIMEOUT = int(os.environ.get('CACHE_TIMEOUT', 300))  # 5 minutes
     
+    # File serving
+    # Run under gunicorn so send_file goes through wsgi.file_wrapper, which
+    # gunicorn serves with os.sendfile (kernel-to-socket, no userspace copy):
+    #   gunicorn -w $GUNICORN_WORKERS --worker-class gthread --threads $GUNICORN_THREADS app:app
+    # Keep sendfile enabled: do not pass --no-sendfile, and terminate TLS in
+    # nginx, since gunicorn falls back to read/write loops over SSL sockets
+    # Read by backend/app.py from the environment:
+    #   USE_X_ACCEL_REDIRECT=true      behind nginx, let nginx serve image and CSV
+    #                                  bodies from its internal /internal/ location
+    #                                  (see config/nginx.conf); default false
+    #   SEND_FILE_MAX_AGE_DEFAULT=<s>  Cache-Control max-age for served files;
+    #                                  unset by default (no max-age)
+    #   WARM_THUMBNAILS=false          disable background thumbnail generation
+    #                                  after scans (default true); the pool gets
+    #                                  cpu_count // GUNICORN_WORKERS threads
+    #   THUMBNAIL_MEMORY_CACHE_SIZE=<n> thumbnails kept in memory per worker
+    #                                  (default 512)
+    #   STAT_WORKERS=<n>               threads used to stat files during scans;
+    #                                  raise for NFS/SMB only (default 1)
+    
     # Performance
+    # Thumbnails fall back to PIL when libvips is unavailable; on such hosts
+    # (with AVX2) install Pillow-SIMD built against libjpeg-turbo instead of
+    # stock Pillow:
+    #   pip uninstall -y pillow
+    #   CC="cc -mavx2" pip install --no-binary :all: pillow-simd==10.0.1.post0
     GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', 4))
+    # Threads per gthread worker: each in-flight download occupies one thread
+    # (not one worker process), so slow clients don't starve the server
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 8))
     GUNICORN_TIMEOUT = int(os.environ.get('GUNICORN_TIMEOUT', 120))
@@ -64,8 +64,8 @@ def main():
     print()
     
     # Check Python version
-    if sys.version_info < (3, 8):
-        print("✗ Python 3.8 or higher is required")
+    if sys.version_info < (3, 10):
+        print("✗ Python 3.10 or higher is required")
         sys.exit(1)
     
     print(f"✓ Python {sys.version_info.major}.{sys.version_info.minor} detected")
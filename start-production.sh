@@ -33,6 +33,7 @@ export FLASK_ENV=${FLASK_ENV:-production}
 export DATA_DIR=${DATA_DIR:-$(pwd)/data}
 export PORT=${PORT:-9000}
 export GUNICORN_WORKERS=${GUNICORN_WORKERS:-4}
+export GUNICORN_THREADS=${GUNICORN_THREADS:-8}
 export GUNICORN_TIMEOUT=${GUNICORN_TIMEOUT:-120}
 export PYTHONPATH=$(pwd)/backend
 
@@ -45,6 +46,7 @@ echo "  Environment: $FLASK_ENV"
 echo "  Data Directory: $DATA_DIR"
 echo "  Port: $PORT"
 echo "  Workers: $GUNICORN_WORKERS"
+echo "  Threads per worker: $GUNICORN_THREADS"
 echo "  Timeout: ${GUNICORN_TIMEOUT}s"
 echo ""
 
@@ -55,6 +57,8 @@ echo ""
 exec gunicorn \
     --bind 0.0.0.0:$PORT \
     --workers $GUNICORN_WORKERS \
+    --worker-class gthread \
+    --threads $GUNICORN_THREADS \
     --timeout $GUNICORN_TIMEOUT \
     --access-logfile - \
     --error-logfile - \